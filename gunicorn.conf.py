@@ -0,0 +1,8 @@
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = 2 * multiprocessing.cpu_count() + 1
+worker_class = 'gthread'
+threads = 8
+keepalive = 30
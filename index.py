@@ -1,19 +1,32 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
 from flask_caching import Cache
-import requests
-from bs4 import BeautifulSoup
-from datetime import datetime
-import concurrent.futures
+import httpx
+from selectolax.lexbor import LexborHTMLParser
+from datetime import datetime, timedelta
+import asyncio
+import os
+import orjson
+import random
+import threading
+import time
 import hashlib
 import logging
-from functools import lru_cache
-from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.cron import CronTrigger
 import atexit
 
 app = Flask(__name__)
 
+class OrjsonProvider(JSONProvider):
+    """Provider JSON baseado em orjson, bem mais rápido que o json da stdlib"""
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+app.json = OrjsonProvider(app)
+
 # Configuração de logs aprimorada
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -30,11 +43,35 @@ configuracao_cache = {
 app.config.from_mapping(configuracao_cache)
 cache = Cache(app)
 
-# Sessão para pool de conexões
-sessao = requests.Session()
-sessao.headers.update({
-    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/107.0.0.0 Safari/537.36'
-})
+# Cliente HTTP assíncrono com pool de conexões keep-alive e novas tentativas
+# em falhas de conexão (reaproveita sessões TLS quentes para o mesmo host)
+cliente = httpx.AsyncClient(
+    http2=True,
+    transport=httpx.AsyncHTTPTransport(
+        http2=True,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+        retries=2
+    ),
+    headers={
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/107.0.0.0 Safari/537.36',
+        'Accept-Encoding': 'gzip, deflate, br'
+    },
+    timeout=10.0
+)
+
+# Loop de eventos dedicado em uma thread daemon: o AsyncClient e suas conexões
+# keep-alive ficam ligados a um único loop vivo durante todo o processo (cada
+# view assíncrona do Flask rodaria em um loop novo, invalidando o pool)
+_loop = asyncio.new_event_loop()
+threading.Thread(target=_loop.run_forever, name='santos-loop', daemon=True).start()
+
+def _executar(corrotina):
+    """Executa a corrotina no loop dedicado e espera o resultado"""
+    return asyncio.run_coroutine_threadsafe(corrotina, _loop).result()
+
+# Endereços base do site raspado
+A12 = 'https://www.a12.com'
+URL_SANTO_DO_DIA = f'{A12}/reze-no-santuario/santo-do-dia'
 
 # Configuração CORS
 CORS(app, resources={
@@ -48,146 +85,299 @@ CORS(app, resources={
     }
 })
 
-def criar_chave_cache(*args, **kwargs):
-    """Cria uma chave única de cache baseada nos argumentos e data atual"""
-    partes_chave = [str(arg) for arg in args]
-    partes_chave.extend(f"{k}:{v}" for k, v in sorted(kwargs.items()))
-    partes_chave.append(datetime.now().strftime("%Y-%m-%d"))
+# Data corrente (UTC) usada nas chaves de cache; renovada pelo tique da meia-noite,
+# evitando um datetime.utcnow() + strftime por requisição
+_DATA_CHAVE = datetime.utcnow().strftime('%Y-%m-%d')
+
+def criar_chave_cache(tipo, *ids):
+    """Cria uma chave de cache legível no formato santos:tipo:ids:data (UTC)"""
+    partes = ':'.join(map(str, ids))
+    return f"santos:{tipo}:{partes}:{_DATA_CHAVE}" if partes else f"santos:{tipo}:{_DATA_CHAVE}"
+
+# Cache de HTML por URL com expiração própria: páginas de dias específicos
+# (?day=...&month=...) nunca mudam, então podem viver bem mais tempo que a
+# página do dia corrente, que precisa virar na meia-noite
+_cache_html = {}
+_trava_cache_html = threading.Lock()
+_CACHE_HTML_MAX = 256
+_TTL_PADRAO = 3600
+_TTL_DIA_FIXO = 86400 * 7
+
+async def buscar_url(url):
+    """Busca URL com tratamento de erro e cache com expiração"""
+    agora = time.monotonic()
+    with _trava_cache_html:
+        registro = _cache_html.get(url)
+        if registro and registro[0] > agora:
+            return registro[1]
 
-    string_chave = "_".join(partes_chave)
-    return hashlib.md5(string_chave.encode()).hexdigest()
-
-@lru_cache(maxsize=128)
-def buscar_url(url):
-    """Busca URL com tratamento de erro e tentativas"""
     try:
-        resposta = sessao.get(url, timeout=10)
+        resposta = await cliente.get(url)
         resposta.raise_for_status()
-        return resposta.text
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         logger.error(f"Erro ao buscar URL {url}: {str(e)}")
         raise
 
-def extrair_info_santo(soup):
+    # Bytes já descomprimidos: o parser aceita bytes direto, sem decode para str
+    html = resposta.content
+    ttl = _TTL_DIA_FIXO if 'day=' in url else _TTL_PADRAO
+    with _trava_cache_html:
+        _armazenar_limitado(_cache_html, url, html, ttl, _CACHE_HTML_MAX, agora)
+    return html
+
+def _armazenar_limitado(cache_dict, chave, valor, ttl, maximo, agora):
+    """Insere no cache descartando entradas expiradas (ou a mais antiga) quando cheio"""
+    if len(cache_dict) >= maximo:
+        for expirada in [c for c, (expira, _) in cache_dict.items() if expira <= agora]:
+            del cache_dict[expirada]
+        if len(cache_dict) >= maximo:
+            cache_dict.pop(next(iter(cache_dict)))
+    cache_dict[chave] = (agora + ttl, valor)
+
+def extrair_info_santo(tree):
     """Extrai informações do santo com tratamento de erro"""
     try:
-        nome_santo = soup.find('div', class_='feature__name').text.strip()
-        infos_santo = soup.find('div', class_='wg-text').find_all('p')
-        elemento_imagem = soup.find("div", class_="feature").find(class_="feature__portrait")
-        imagem = "https://www.a12.com" + elemento_imagem["src"] if elemento_imagem else None
+        # Localiza o bloco feature uma única vez e consulta apenas dentro dele
+        feature = tree.css_first('div.feature')
+        nome_santo = feature.css_first('.feature__name').text().strip()
+        elemento_imagem = feature.css_first('.feature__portrait')
+        imagem = f"{A12}{elemento_imagem.attributes.get('src')}" if elemento_imagem else None
+
+        # Uma única passada pelos <p>, já descartando os vazios; strip() só nas
+        # pontas — text(strip=True) removeria os espaços em volta de tags inline
+        textos = [texto for p in tree.css('div.wg-text p') if (texto := p.text().strip())]
 
         return {
             'nome': nome_santo,
             'imagem': imagem,
-            'historia': "\n\n".join(p.text.strip() for p in infos_santo[:-4] if p.text.strip()),
-            'reflexao': "\n\n".join(p.text.strip() for p in infos_santo[-3:-2] if p.text.strip()),
-            'oracao': "\n\n".join(p.text.strip() for p in infos_santo[-1:] if p.text.strip())
+            'historia': "\n\n".join(textos[:-4]),
+            'reflexao': "\n\n".join(textos[-3:-2]),
+            'oracao': "\n\n".join(textos[-1:])
         }
     except Exception as e:
         logger.error(f"Erro ao extrair informações do santo: {str(e)}")
         return None
 
-def buscar_dados_santo(url):
-    """Busca e processa dados do santo"""
+# Cache do dicionário já extraído por URL de santo: a página de um santo é
+# estável ao longo do dia, então no cache quente evita busca e parsing
+_cache_santos = {}
+_trava_cache_santos = threading.Lock()
+_CACHE_SANTOS_MAX = 512
+_TTL_SANTO = 86400
+
+async def buscar_dados_santo(url):
+    """Busca e processa dados do santo, memoizando o resultado extraído"""
+    agora = time.monotonic()
+    with _trava_cache_santos:
+        registro = _cache_santos.get(url)
+        if registro and registro[0] > agora:
+            return registro[1]
+
     try:
-        html = buscar_url(url)
-        soup = BeautifulSoup(html, 'html.parser')
-        return extrair_info_santo(soup)
+        html = await buscar_url(url)
+        tree = LexborHTMLParser(html)
+        info_santo = extrair_info_santo(tree)
     except Exception as e:
         logger.error(f"Erro ao processar URL {url}: {str(e)}")
         return None
 
-def limpar_e_atualizar_cache():
-    """Limpa cache e pré-carrega novos dados"""
+    if info_santo:
+        with _trava_cache_santos:
+            _armazenar_limitado(_cache_santos, url, info_santo, _TTL_SANTO,
+                                _CACHE_SANTOS_MAX, agora)
+    return info_santo
+
+# Limite de buscas simultâneas do processo inteiro, ajustável por variável de
+# ambiente; o semáforo é compartilhado porque toda corrotina roda no loop dedicado
+MAX_CONCORRENCIA = int(os.getenv('SANTOS_MAX_WORKERS', '16'))
+_semaforo_buscas = asyncio.Semaphore(MAX_CONCORRENCIA)
+
+async def buscar_santos(urls):
+    """Busca os dados de vários santos em paralelo com concorrência limitada"""
+    async def _com_limite(url):
+        async with _semaforo_buscas:
+            return await buscar_dados_santo(url)
+
+    santos = await asyncio.gather(*(_com_limite(url) for url in urls))
+    return list(filter(None, santos))
+
+async def buscar_santos_da_pagina(url):
+    """Busca uma página-índice e retorna os santos listados (ou o santo único)"""
+    html = await buscar_url(url)
+    tree = LexborHTMLParser(html)
+    links_santos = tree.css('div.saints-list a[href]')
+
+    if links_santos:
+        urls_santos = [a.attributes['href'] for a in links_santos]
+        return await buscar_santos(urls_santos)
+
+    info_santo = extrair_info_santo(tree)
+    return [info_santo] if info_santo else []
+
+# Respostas prontas em memória: bytes JSON já serializados + ETag por chave.
+# No caminho quente a rota devolve esses bytes direto, sem tocar o backend de
+# cache nem reserializar o payload. O refresh diário monta um dicionário novo
+# e troca a referência de uma vez, então leitores nunca precisam de trava
+_servidos = {}
+_SERVIDOS_MAX = 64
+
+def _serializar_resposta(santos):
+    """Serializa o payload uma única vez: (etag, bytes prontos para servir)"""
+    corpo = orjson.dumps({'resultados': santos})
+    return hashlib.md5(corpo).hexdigest(), corpo
+
+def _guardar_resposta(chave, santos):
+    """Registra a resposta pronta no dicionário servido, limitando o tamanho"""
+    if not santos:
+        return
+    if chave not in _servidos and len(_servidos) >= _SERVIDOS_MAX:
+        # Datas arbitrárias em /dia=<d>&mes=<m> não podem crescer sem limite
+        # até a troca da meia-noite; descarta a entrada mais antiga
+        _servidos.pop(next(iter(_servidos)))
+    _servidos[chave] = _serializar_resposta(santos)
+
+def _montar_resposta(chave, status_cache='HIT'):
+    """Monta a resposta pronta para a chave, honrando If-None-Match com 304"""
+    registro = _servidos.get(chave)
+    if not registro:
+        return None
+
+    etag, corpo = registro
+    if request.if_none_match.contains(etag):
+        resposta = Response(status=304)
+    else:
+        resposta = Response(corpo, mimetype='application/json')
+    resposta.set_etag(etag)
+    resposta.headers['Cache-Control'] = 'public, max-age=3600, stale-while-revalidate=86400'
+    resposta.headers['X-Status-Cache'] = status_cache
+    return resposta
+
+async def _aquecer_url(url, hoje):
+    """Busca uma página-índice e retorna (chave_cache, santos), ou None em falha"""
+    try:
+        santos = await buscar_santos_da_pagina(url)
+        if not santos:
+            # Página carregou mas nada foi extraído: trata como falha para o
+            # refresh manter os dados do dia anterior
+            logger.error(f"Aquecimento não extraiu nenhum santo de {url}")
+            return None
+        if 'day' in url:
+            chave_cache = criar_chave_cache('data', hoje.day, hoje.month)
+        else:
+            chave_cache = criar_chave_cache('inicio')
+        return chave_cache, santos
+    except Exception as e:
+        logger.error(f"Erro ao pré-carregar dados para URL {url}: {str(e)}")
+        return None
+
+async def _atualizar_cache():
+    """Pré-carrega os dados do dia e só então publica os novos caches"""
     try:
         logger.info("Iniciando limpeza e atualização diária do cache...")
-        
-        # Limpa todos os caches
-        cache.clear()
-        buscar_url.cache_clear()
-        
-        # Pré-carrega dados do dia
+
+        # Descarta o HTML e os dicionários por URL antes de buscar — senão o
+        # aquecimento relê a página-índice da véspera e congela os santos de
+        # ontem sob a chave de hoje
+        with _trava_cache_html:
+            _cache_html.clear()
+        with _trava_cache_santos:
+            _cache_santos.clear()
+
+        # Pré-carrega as duas páginas-índice do dia em paralelo
         hoje = datetime.now()
         urls = [
-            'https://www.a12.com/reze-no-santuario/santo-do-dia',
-            f'https://www.a12.com/reze-no-santuario/santo-do-dia?day={hoje.day}&month={hoje.month}'
+            URL_SANTO_DO_DIA,
+            f'{URL_SANTO_DO_DIA}?day={hoje.day}&month={hoje.month}'
         ]
-        
-        for url in urls:
-            try:
-                html = buscar_url(url)
-                soup = BeautifulSoup(html, 'html.parser')
-                lista_santos = soup.find("div", class_="saints-list")
-                
-                if lista_santos:
-                    urls_santos = [a['href'] for a in lista_santos.find_all('a', href=True)]
-                    with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-                        santos = list(filter(None, executor.map(buscar_dados_santo, urls_santos)))
-                else:
-                    info_santo = extrair_info_santo(soup)
-                    if info_santo:
-                        santos = [info_santo]
-                        
-                # Armazena os novos dados em cache
-                chave_cache = criar_chave_cache('inicio' if 'day' not in url else f'data_{hoje.day}_{hoje.month}')
-                cache.set(chave_cache, santos)
-                
-            except Exception as e:
-                logger.error(f"Erro ao pré-carregar dados para URL {url}: {str(e)}")
-                
-        logger.info("Limpeza e atualização diária do cache concluída com sucesso")
+        resultados = await asyncio.gather(*(_aquecer_url(url, hoje) for url in urls))
+        aquecidos = [resultado for resultado in resultados if resultado]
+
+        if not aquecidos:
+            logger.error("Aquecimento diário falhou para todas as páginas; "
+                         "mantendo os caches do dia anterior")
+            return
+
+        # Publica só depois do aquecimento dar certo: até aqui os leitores
+        # continuam servindo o dia anterior, nunca um estado parcialmente
+        # montado, e a troca de referência é atômica
+        cache.clear()
+        novos_servidos = {}
+        for chave_cache, santos in aquecidos:
+            cache.set(chave_cache, santos)
+            novos_servidos[chave_cache] = _serializar_resposta(santos)
+        global _servidos
+        _servidos = novos_servidos
+
+        if len(aquecidos) == len(urls):
+            logger.info("Limpeza e atualização diária do cache concluída com sucesso")
+        else:
+            logger.warning(f"Atualização diária concluída parcialmente "
+                           f"({len(aquecidos)} de {len(urls)} páginas)")
     except Exception as e:
         logger.error(f"Erro em limpar_e_atualizar_cache: {str(e)}")
 
-# Inicializa o agendador
-agendador = BackgroundScheduler()
-agendador.add_job(
-    func=limpar_e_atualizar_cache,
-    trigger=CronTrigger(hour=0, minute=0),  # Executa à meia-noite
-    id='tarefa_limpar_cache',
-    name='Limpar cache e atualizar dados à meia-noite',
-    replace_existing=True
-)
-
-# Inicia o agendador
-agendador.start()
+def limpar_e_atualizar_cache():
+    """Executa a atualização assíncrona a partir do agendador (thread síncrona)"""
+    _executar(_atualizar_cache())
+
+# Agendamento leve da atualização diária: um único Timer até a próxima
+# meia-noite, que se reagenda após cada execução
+_timer_meia_noite = None
+
+def _tique_meia_noite():
+    """Renova a data das chaves, executa a atualização diária e agenda o próximo tique"""
+    global _DATA_CHAVE
+    _DATA_CHAVE = datetime.utcnow().strftime('%Y-%m-%d')
+    limpar_e_atualizar_cache()
+    _agendar_meia_noite()
+
+def _agendar_meia_noite():
+    """Agenda um Timer daemon para a próxima meia-noite"""
+    global _timer_meia_noite
+    agora = datetime.now()
+    proxima = (agora + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    _timer_meia_noite = threading.Timer((proxima - agora).total_seconds(), _tique_meia_noite)
+    _timer_meia_noite.daemon = True
+    _timer_meia_noite.start()
+
+_agendar_meia_noite()
 
 @app.before_request
 def antes_requisicao():
-    """Log de estatísticas do cache antes de cada requisição"""
-    logger.info(f"Estatísticas do cache: {cache.get_stats()}")
+    """Loga o tamanho dos caches de forma amostrada (~1% das requisições)"""
+    if logger.isEnabledFor(logging.INFO) and random.random() < 0.01:
+        logger.info(f"Caches: {len(_servidos)} respostas prontas, "
+                    f"{len(_cache_html)} páginas HTML, {len(_cache_santos)} santos")
 
 @app.after_request
 def apos_requisicao(resposta):
-    """Adiciona status do cache ao cabeçalho da resposta"""
-    resposta.headers['X-Status-Cache'] = 'HIT' if resposta.cache_control.public else 'MISS'
+    """Garante o cabeçalho de status do cache na resposta"""
+    resposta.headers.setdefault('X-Status-Cache', 'MISS')
     return resposta
 
 @app.route("/")
 def inicio():
     chave_cache = criar_chave_cache('inicio')
-    dados_cache = cache.get(chave_cache)
+    resposta_pronta = _montar_resposta(chave_cache)
+    if resposta_pronta:
+        return resposta_pronta
 
+    dados_cache = cache.get(chave_cache)
     if dados_cache:
-        return jsonify(resultados=dados_cache)
+        _guardar_resposta(chave_cache, dados_cache)
+        return _montar_resposta(chave_cache)
 
     try:
-        html = buscar_url('https://www.a12.com/reze-no-santuario/santo-do-dia')
-        soup = BeautifulSoup(html, 'html.parser')
-        lista_santos = soup.find("div", class_="saints-list")
-
-        urls = []
-        if lista_santos:
-            urls = [a['href'] for a in lista_santos.find_all('a', href=True)]
-
-        with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-            santos = list(filter(None, executor.map(buscar_dados_santo, urls)))
+        santos = _executar(buscar_santos_da_pagina(URL_SANTO_DO_DIA))
 
-        if not santos and not lista_santos:
-            santos = [extrair_info_santo(soup)]
+        # Não congela um resultado vazio (layout mudou?): sem armazenar,
+        # a próxima requisição tenta o site de novo
+        if not santos:
+            return jsonify(resultados=santos)
 
         cache.set(chave_cache, santos)
-        return jsonify(resultados=santos)
+        _guardar_resposta(chave_cache, santos)
+        return _montar_resposta(chave_cache, status_cache='MISS')
     except Exception as e:
         logger.error(f"Erro na rota inicial: {str(e)}")
         return jsonify(erro=str(e)), 500
@@ -195,29 +385,27 @@ def inicio():
 @app.route("/dia=<int:dia>&mes=<int:mes>")
 def data(dia, mes):
     chave_cache = criar_chave_cache('data', dia, mes)
-    dados_cache = cache.get(chave_cache)
+    resposta_pronta = _montar_resposta(chave_cache)
+    if resposta_pronta:
+        return resposta_pronta
 
+    dados_cache = cache.get(chave_cache)
     if dados_cache:
-        return jsonify(resultados=dados_cache)
+        _guardar_resposta(chave_cache, dados_cache)
+        return _montar_resposta(chave_cache)
 
     try:
-        url = f'https://www.a12.com/reze-no-santuario/santo-do-dia?day={dia}&month={mes}'
-        html = buscar_url(url)
-        soup = BeautifulSoup(html, 'html.parser')
-        lista_santos = soup.find("div", class_="saints-list")
-
-        santos = []
-        if lista_santos:
-            urls = [a['href'] for a in lista_santos.find_all('a', href=True)]
-            with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-                santos = list(filter(None, executor.map(buscar_dados_santo, urls)))
-        else:
-            info_santo = extrair_info_santo(soup)
-            if info_santo:
-                santos = [info_santo]
+        url = f'{URL_SANTO_DO_DIA}?day={dia}&month={mes}'
+        santos = _executar(buscar_santos_da_pagina(url))
+
+        # Não congela um resultado vazio (layout mudou?): sem armazenar,
+        # a próxima requisição tenta o site de novo
+        if not santos:
+            return jsonify(resultados=santos)
 
         cache.set(chave_cache, santos)
-        return jsonify(resultados=santos)
+        _guardar_resposta(chave_cache, santos)
+        return _montar_resposta(chave_cache, status_cache='MISS')
     except Exception as e:
         logger.error(f"Erro na rota de data: {str(e)}")
         return jsonify(erro=str(e)), 500
@@ -225,20 +413,23 @@ def data(dia, mes):
 @app.route("/limpar-cache")
 def limpar_cache():
     """Limpa todos os caches manualmente"""
+    global _servidos
     try:
         cache.clear()
-        buscar_url.cache_clear()
+        _servidos = {}
+        with _trava_cache_html:
+            _cache_html.clear()
+        with _trava_cache_santos:
+            _cache_santos.clear()
         return jsonify(mensagem="Todos os caches foram limpos com sucesso")
     except Exception as e:
         logger.error(f"Erro ao limpar cache: {str(e)}")
         return jsonify(erro=str(e)), 500
 
-# Registra o desligamento do agendador quando a aplicação for encerrada
-atexit.register(lambda: agendador.shutdown())
+# Cancela o Timer pendente quando a aplicação for encerrada
+atexit.register(lambda: _timer_meia_noite and _timer_meia_noite.cancel())
 
 if __name__ == "__main__":
-    try:
-        app.run(debug=True, port=5000)  # Substitua 5000 pela porta desejada
-    except (KeyboardInterrupt, SystemExit):
-        # Garante que o agendador seja encerrado adequadamente
-        agendador.shutdown()
+    # Servidor de desenvolvimento; em produção use o gunicorn (ver Procfile)
+    app.run(host='0.0.0.0', port=int(os.getenv('PORT', 5000)),
+            debug=os.getenv('DEBUG', '').lower() in ('1', 'true'))